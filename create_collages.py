@@ -5,29 +5,90 @@ Create collages from generated figure images in various grid arrangements.
 Usage:
     python create_collages.py --grid_size 5x5 --images_folder ./data
     python create_collages.py --grid_size 10x10 --images_folder ./data_simple --output_folder ./my_collages
+    python create_collages.py --grid_size 5x5 --images_folder ./data.tar
 """
 
 import os
+import io
 import sys
+import re
+import tarfile
 import random
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from PIL import Image
 
-# Canvas dimensions from original script
-CANVAS_WIDTH = 300
-CANVAS_HEIGHT = 500
+from pipeline_core import new_collage, tile_position, flip_tile, CANVAS_WIDTH, CANVAS_HEIGHT
 
-def create_collage(image_paths, cols, rows, output_path, flip_hor=0.0, flip_ver=0.0):
+def _load_image(img_path):
+    """
+    Open and fully decode an image (from a path or a file-like object),
+    converted to RGB so that each paste into the collage is a plain copy
+    (simple figures are saved as palette images).
+
+    img_path may also be the exception raised while reading an archive
+    member, which is then reported as the failure.
+
+    Returns:
+    - tuple of (image, None) on success or (None, exception) on failure
+    """
+    if isinstance(img_path, Exception):
+        return None, img_path
+    try:
+        img = Image.open(img_path)
+        img.load()
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return img, None
+    except Exception as e:
+        return None, e
+
+def open_image_archive(archive_path):
+    """
+    Open a .tar archive of figure images.
+
+    Returns:
+    - tuple of (open TarFile, dict mapping PNG member name -> TarInfo)
+    """
+    archive = tarfile.open(archive_path, 'r')
+    try:
+        members = {
+            member.name: member
+            for member in archive.getmembers()
+            if member.isfile() and member.name.endswith('.png')
+        }
+    except BaseException:
+        archive.close()
+        raise
+    return archive, members
+
+def _read_archive_members(tar, members):
+    """
+    Read archive members into memory, one at a time.
+
+    Yields a BytesIO per member, or the exception if the member could not be
+    read, so that a single bad member is skipped like a bad image file.
+    """
+    for member in members:
+        try:
+            yield io.BytesIO(tar.extractfile(member).read())
+        except (tarfile.TarError, OSError) as e:
+            yield e
+
+def create_collage(image_paths, cols, rows, output_path, flip_hor=0.0, flip_ver=0.0, archive=None):
     """
     Create a collage from a list of image paths.
 
     Parameters:
-    - image_paths: list of paths to images
+    - image_paths: list of paths to images (member names if archive is given)
     - cols: number of columns in grid
     - rows: number of rows in grid
     - output_path: path to save the collage
     - flip_hor: probability (0.0-1.0) that an image will be flipped horizontally
     - flip_ver: probability (0.0-1.0) that an image will be flipped vertically
+    - archive: optional (TarFile, members) pair from open_image_archive()
     """
     num_images = cols * rows
 
@@ -36,45 +97,59 @@ def create_collage(image_paths, cols, rows, output_path, flip_hor=0.0, flip_ver=
     selected_images = random.choices(image_paths, k=num_images)
 
     # Create blank canvas for collage
-    collage_width = CANVAS_WIDTH * cols
-    collage_height = CANVAS_HEIGHT * rows
-    collage = Image.new('RGB', (collage_width, collage_height), 'white')
+    collage = new_collage(cols, rows)
 
     # Track flips for statistics
     flipped_hor_count = 0
     flipped_ver_count = 0
+    placed_count = 0
 
-    # Place images in grid
+    # Group grid positions by source image so that each file is decoded only
+    # once, no matter how many times it was drawn
+    placements = {}
     for idx, img_path in enumerate(selected_images):
-        row = idx // cols
-        col = idx % cols
-
-        # Calculate position
-        x = col * CANVAS_WIDTH
-        y = row * CANVAS_HEIGHT
-
-        # Load and paste image
-        try:
-            img = Image.open(img_path)
-
-            # Randomly flip image horizontally based on flip_hor
-            if random.random() < flip_hor:
-                img = img.transpose(Image.FLIP_LEFT_RIGHT)
-                flipped_hor_count += 1
-
-            # Randomly flip image vertically based on flip_ver
-            if random.random() < flip_ver:
-                img = img.transpose(Image.FLIP_TOP_BOTTOM)
-                flipped_ver_count += 1
-
-            collage.paste(img, (x, y))
-        except Exception as e:
-            print(f"Error loading {img_path}: {e}")
-            continue
-
-        # Progress indicator
-        if (idx + 1) % 20 == 0:
-            print(f"  Placed {idx + 1}/{num_images} images...")
+        placements.setdefault(img_path, []).append(idx)
+
+    # Decode in a thread pool (PIL releases the GIL while decoding) and place
+    # each image in the grid as soon as it is ready
+    if archive is not None:
+        # TarFile reads are not thread-safe: read the raw bytes here and
+        # leave only the decoding to the threads
+        tar, members = archive
+        sources = _read_archive_members(tar, [members[name] for name in placements])
+    else:
+        sources = iter(placements)
+
+    # Keep only a small window of decodes in flight, so decoded images cannot
+    # pile up while the grid is being pasted
+    max_workers = min(16, (os.cpu_count() or 1) * 2)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque(executor.submit(_load_image, source)
+                        for source in islice(sources, 2 * max_workers))
+        for img_path, indices in placements.items():
+            source, error = pending.popleft().result()
+            next_source = next(sources, None)
+            if next_source is not None:
+                pending.append(executor.submit(_load_image, next_source))
+
+            if error is not None:
+                print(f"Error loading {img_path}: {error}")
+                continue
+
+            for idx in indices:
+                # Randomly flip image based on flip_hor / flip_ver
+                do_flip_hor = random.random() < flip_hor
+                do_flip_ver = random.random() < flip_ver
+                flipped_hor_count += do_flip_hor
+                flipped_ver_count += do_flip_ver
+
+                img = flip_tile(source, do_flip_hor, do_flip_ver)
+                collage.paste(img, tile_position(idx, cols))
+                placed_count += 1
+
+                # Progress indicator
+                if placed_count % 20 == 0:
+                    print(f"  Placed {placed_count}/{num_images} images...")
 
     # Save collage
     collage.save(output_path, 'PNG')
@@ -104,27 +179,15 @@ def filter_images_by_params(image_paths, filter_params):
     # Parse filter parameters
     filters = [f.strip() for f in filter_params.split(',')]
 
-    filtered_images = []
-    for img_path in image_paths:
-        filename = os.path.basename(img_path)
-
-        # Check if all filter criteria match in filename
-        match = True
-        for filter_str in filters:
-            # Convert filter to pattern that appears in filename
-            # e.g., 'a100' should match '_a100_' or '_a100.'
-            # e.g., 'col444444' should match '_col444444_' or '_col444444.'
-            pattern = f"_{filter_str}_"
-            pattern_end = f"_{filter_str}."
+    # Compile all criteria into one regex. Each filter must appear in the
+    # filename as a whole field, e.g. 'a100' matches '_a100_' or '_a100.'
+    # and 'col444444' matches '_col444444_' or '_col444444.'
+    pattern = re.compile(''.join(f'(?=.*_{re.escape(f)}[_.])' for f in filters))
 
-            if pattern not in filename and pattern_end not in filename:
-                match = False
-                break
-
-        if match:
-            filtered_images.append(img_path)
-
-    return filtered_images
+    return [
+        img_path for img_path in image_paths
+        if pattern.match(os.path.basename(img_path))
+    ]
 
 def parse_grid_size(grid_str):
     """
@@ -151,6 +214,124 @@ def parse_grid_size(grid_str):
     except ValueError as e:
         raise ValueError(f"Invalid grid size '{grid_str}': {e}")
 
+def create_collage_from_folder(grid_size, images_folder, output_folder='./collages',
+                               flip_hor=0.0, flip_ver=0.0, select_only_from=None):
+    """
+    Build one collage from a folder (or .tar archive) of figure images.
+
+    This is the whole of the command line tool, callable in-process.
+
+    Parameters:
+    - grid_size: grid size in format COLSxROWS (e.g., "5x5")
+    - images_folder: folder containing images, or a .tar archive of them
+    - output_folder: folder to save the collage in
+    - flip_hor: probability (0.0-1.0) that a figure will be flipped horizontally
+    - flip_ver: probability (0.0-1.0) that a figure will be flipped vertically
+    - select_only_from: optional filter string, see filter_images_by_params()
+
+    Returns:
+    - True if the collage was saved, False otherwise (the error is printed)
+    """
+    # Validate flip parameters
+    if not 0.0 <= flip_hor <= 1.0:
+        print(f"Error: flip_hor must be between 0.0 and 1.0, got {flip_hor}")
+        return False
+    if not 0.0 <= flip_ver <= 1.0:
+        print(f"Error: flip_ver must be between 0.0 and 1.0, got {flip_ver}")
+        return False
+
+    # Parse grid size
+    try:
+        cols, rows = parse_grid_size(grid_size)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return False
+
+    # Validate input directory (or archive)
+    is_archive = images_folder.endswith('.tar')
+    if is_archive and not os.path.isfile(images_folder):
+        print(f"Error: Images archive '{images_folder}' does not exist")
+        return False
+    if not is_archive and not os.path.isdir(images_folder):
+        print(f"Error: Images folder '{images_folder}' does not exist")
+        return False
+
+    # Create output directory
+    os.makedirs(output_folder, exist_ok=True)
+
+    # Get all PNG files from images directory
+    print(f"Scanning {images_folder} for images...")
+    archive = None
+    try:
+        if is_archive:
+            try:
+                archive = open_image_archive(images_folder)
+            except (tarfile.TarError, OSError) as e:
+                print(f"Error: Cannot read images archive '{images_folder}': {e}")
+                return False
+            image_files = list(archive[1])
+        else:
+            with os.scandir(images_folder) as entries:
+                image_files = [
+                    entry.path
+                    for entry in entries
+                    if entry.name.endswith('.png') and entry.is_file()
+                ]
+
+        if not image_files:
+            print(f"Error: No PNG images found in {images_folder}")
+            return False
+
+        print(f"Found {len(image_files)} images")
+
+        # Filter images if select_only_from is specified
+        if select_only_from:
+            original_count = len(image_files)
+            image_files = filter_images_by_params(image_files, select_only_from)
+
+            if not image_files:
+                print(f"Error: No images match the filter criteria '{select_only_from}'")
+                return False
+
+            print(f"Filtered to {len(image_files)} images matching '{select_only_from}' (from {original_count} total)")
+
+        # Create collage
+        num_images = cols * rows
+        flip_info = ""
+        if flip_hor > 0:
+            flip_info += f" {flip_hor*100:.0f}% horizontal flip"
+        if flip_ver > 0:
+            if flip_info:
+                flip_info += ","
+            flip_info += f" {flip_ver*100:.0f}% vertical flip"
+        if flip_info:
+            flip_info = f" with{flip_info}"
+
+        print(f"\nCreating {cols}x{rows} collage ({num_images} images){flip_info}...")
+
+        # Include flip values in filename
+        flip_str = ""
+        if flip_hor > 0 or flip_ver > 0:
+            flip_str = f"_fh{flip_hor:.2f}_fv{flip_ver:.2f}".replace('.', '_')
+        output_filename = f"collage_{cols}x{rows}{flip_str}.png"
+        output_path = os.path.join(output_folder, output_filename)
+
+        success = create_collage(image_files, cols, rows, output_path, flip_hor, flip_ver, archive)
+    finally:
+        # Close the archive however the collage ends (early return or error)
+        if archive is not None:
+            archive[0].close()
+
+    if success:
+        # Calculate file size
+        file_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
+        print(f"  Size: {CANVAS_WIDTH * cols}x{CANVAS_HEIGHT * rows}px ({file_size:.2f} MB)")
+        print(f"\nCollage saved to {output_path}")
+        return True
+
+    print("\nFailed to create collage")
+    return False
+
 def main():
     """Generate collages from generated figure images."""
     # Parse command line arguments
@@ -161,6 +342,7 @@ def main():
 Examples:
   %(prog)s --grid_size 5x5 --images_folder ./data
   %(prog)s --grid_size 10x16 --images_folder ./data_simple --output_folder ./my_collages
+  %(prog)s --grid_size 5x5 --images_folder ./data.tar
   %(prog)s -g 8x10 -i ./data -o ./collages --flip 0.5
   %(prog)s -g 5x5 -i ./data -f 0.3
   %(prog)s -g 10x10 -i ./data_simple -s "a100,b50,col444444"
@@ -179,7 +361,7 @@ Examples:
         '--images_folder', '-i',
         type=str,
         required=True,
-        help='Path to folder containing images'
+        help='Path to folder containing images, or to a .tar archive of them'
     )
 
     parser.add_argument(
@@ -212,85 +394,11 @@ Examples:
 
     args = parser.parse_args()
 
-    # Validate flip parameters
-    if not 0.0 <= args.flip_hor <= 1.0:
-        print(f"Error: flip_hor must be between 0.0 and 1.0, got {args.flip_hor}")
-        sys.exit(1)
-    if not 0.0 <= args.flip_ver <= 1.0:
-        print(f"Error: flip_ver must be between 0.0 and 1.0, got {args.flip_ver}")
-        sys.exit(1)
-
-    # Parse grid size
-    try:
-        cols, rows = parse_grid_size(args.grid_size)
-    except ValueError as e:
-        print(f"Error: {e}")
-        sys.exit(1)
-
-    # Validate input directory
-    if not os.path.isdir(args.images_folder):
-        print(f"Error: Images folder '{args.images_folder}' does not exist")
-        sys.exit(1)
-
-    # Create output directory
-    output_dir = args.output_folder
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Get all PNG files from images directory
-    print(f"Scanning {args.images_folder} for images...")
-    image_files = [
-        os.path.join(args.images_folder, f)
-        for f in os.listdir(args.images_folder)
-        if f.endswith('.png')
-    ]
-
-    if not image_files:
-        print(f"Error: No PNG images found in {args.images_folder}")
-        sys.exit(1)
-
-    print(f"Found {len(image_files)} images")
-
-    # Filter images if select_only_from is specified
-    if args.select_only_from:
-        original_count = len(image_files)
-        image_files = filter_images_by_params(image_files, args.select_only_from)
-
-        if not image_files:
-            print(f"Error: No images match the filter criteria '{args.select_only_from}'")
-            sys.exit(1)
-
-        print(f"Filtered to {len(image_files)} images matching '{args.select_only_from}' (from {original_count} total)")
-
-    # Create collage
-    num_images = cols * rows
-    flip_info = ""
-    if args.flip_hor > 0:
-        flip_info += f" {args.flip_hor*100:.0f}% horizontal flip"
-    if args.flip_ver > 0:
-        if flip_info:
-            flip_info += ","
-        flip_info += f" {args.flip_ver*100:.0f}% vertical flip"
-    if flip_info:
-        flip_info = f" with{flip_info}"
-
-    print(f"\nCreating {cols}x{rows} collage ({num_images} images){flip_info}...")
-
-    # Include flip values in filename
-    flip_str = ""
-    if args.flip_hor > 0 or args.flip_ver > 0:
-        flip_str = f"_fh{args.flip_hor:.2f}_fv{args.flip_ver:.2f}".replace('.', '_')
-    output_filename = f"collage_{cols}x{rows}{flip_str}.png"
-    output_path = os.path.join(output_dir, output_filename)
-
-    success = create_collage(image_files, cols, rows, output_path, args.flip_hor, args.flip_ver)
-
-    if success:
-        # Calculate file size
-        file_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
-        print(f"  Size: {CANVAS_WIDTH * cols}x{CANVAS_HEIGHT * rows}px ({file_size:.2f} MB)")
-        print(f"\nCollage saved to {output_path}")
-    else:
-        print("\nFailed to create collage")
+    success = create_collage_from_folder(
+        args.grid_size, args.images_folder, args.output_folder,
+        args.flip_hor, args.flip_ver, args.select_only_from
+    )
+    if not success:
         sys.exit(1)
 
 if __name__ == '__main__':
@@ -11,8 +11,8 @@ import sys
 import argparse
 import random
 import re
-from tqdm import tqdm
-from PIL import Image
+
+from figure_io import PNG_COMPRESS_LEVEL
 
 def parse_parameter(param_str, is_color=False):
     """
@@ -135,6 +135,14 @@ Parameter Formats:
         required=True,
         help='Output file path for the final collage (e.g., ./my_collage.png)'
     )
+    parser.add_argument(
+        '--png_compress_level',
+        type=int,
+        default=PNG_COMPRESS_LEVEL,
+        choices=range(10),
+        metavar='{0-9}',
+        help=f'PNG compression level for individual figures saved to --output_folder (default: {PNG_COMPRESS_LEVEL}, fastest with compression)'
+    )
 
     # Collage parameters
     collage_group = parser.add_argument_group('Collage Parameters')
@@ -217,11 +225,11 @@ Parameter Formats:
     if args.flip_ver > 0:
         print(f"  flip_ver: {args.flip_ver*100:.0f}% chance per image")
 
-    # Import generation function
+    # Import collage rendering
     try:
-        from generate_figures_simple import generate_figure
+        from pipeline_core import render_collage
     except ImportError as e:
-        print(f"Error importing generate_figures_simple: {e}")
+        print(f"Error importing pipeline_core: {e}")
         sys.exit(1)
 
     # Create output folder if specified
@@ -236,63 +244,28 @@ Parameter Formats:
 
     print(f"\nGenerating collage...")
 
-    # Generate images and build collage
-    images = []
-    flip_hor_count = 0
-    flip_ver_count = 0
-
-    for i in tqdm(range(total_images), desc="Generating images", unit="img"):
-        # Randomly select parameter values
-        a = select_random_value(param_configs['a'])
-        b = select_random_value(param_configs['b'])
-        c = select_random_value(param_configs['c'])
-        d = select_random_value(param_configs['d'])
-        e = select_random_value(param_configs['e'])
-        f = select_random_value(param_configs['f'])
-        g = select_random_value(param_configs['g'])
-        stroke_width = select_random_value(param_configs['stroke_width'])
-        stroke_color_code = select_random_value(param_configs['stroke_color'])
-
-        # Add # prefix to color
-        stroke_color = f'#{stroke_color_code}'
-
-        # Generate the figure
-        img = generate_figure(a, b, c, d, e, f, g, stroke_width, stroke_color)
-
-        # Apply horizontal flip if needed
-        if random.random() < args.flip_hor:
-            img = img.transpose(Image.FLIP_LEFT_RIGHT)
-            flip_hor_count += 1
-
-        # Apply vertical flip if needed
-        if random.random() < args.flip_ver:
-            img = img.transpose(Image.FLIP_TOP_BOTTOM)
-            flip_ver_count += 1
-
-        # Save individual image if output folder specified
-        if args.output_folder:
-            filename = f"fig_a{a}_b{b}_c{c}_d{d}_e{e}_f{f}_g{g}_w{stroke_width}_col{stroke_color_code}.png"
-            filepath = os.path.join(args.output_folder, filename)
-            img.save(filepath, 'PNG')
-
-        images.append(img)
-
-    # Get dimensions from first image
-    img_width, img_height = images[0].size
-
-    # Create collage canvas
-    collage_width = cols * img_width
-    collage_height = rows * img_height
-    collage = Image.new('RGB', (collage_width, collage_height), 'white')
-
-    # Place images in grid
-    print("\nAssembling collage...")
-    for idx, img in enumerate(images):
-        row = idx // cols
-        col = idx % cols
-        x = col * img_width
-        y = row * img_height
-        collage.paste(img, (x, y))
+    # Randomly select parameter values for every tile
+    tile_params = []
+    for _ in range(total_images):
+        tile_params.append((
+            select_random_value(param_configs['a']),
+            select_random_value(param_configs['b']),
+            select_random_value(param_configs['c']),
+            select_random_value(param_configs['d']),
+            select_random_value(param_configs['e']),
+            select_random_value(param_configs['f']),
+            select_random_value(param_configs['g']),
+            select_random_value(param_configs['stroke_width']),
+            select_random_value(param_configs['stroke_color']),
+        ))
+
+    # Render the collage in memory; figures only touch disk with --output_folder
+    collage, flip_hor_count, flip_ver_count = render_collage(
+        tile_params, cols, rows, args.flip_hor, args.flip_ver,
+        output_folder=args.output_folder,
+        png_compress_level=args.png_compress_level,
+    )
+    collage_width, collage_height = collage.size
 
     # Save collage
     collage.save(args.output_collage_file, 'PNG')
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Output helpers shared by the figure generators.
+"""
+
+import io
+import os
+import tarfile
+
+# PNG compression level for saved figures (zlib 0-9). The figures are flat
+# line art, so fast compression costs little size and encodes much faster.
+PNG_COMPRESS_LEVEL = 1
+
+def save_png(img, filepath, compress_level=PNG_COMPRESS_LEVEL):
+    """
+    Save img as a PNG at filepath, atomically.
+
+    The PNG is written to a temporary file in the same folder and then
+    renamed into place, so a file at filepath is always complete even if the
+    run is interrupted. Skipping figures that already exist relies on this.
+    The temporary name includes the process id, so worker processes writing
+    the same figure never move each other's file away.
+    """
+    tmp_path = f'{filepath}.{os.getpid()}.tmp'
+    try:
+        img.save(tmp_path, 'PNG', compress_level=compress_level)
+    except BaseException:
+        # Don't leave a partial temporary file behind in the output folder
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, filepath)
+
+def encode_png(img, compress_level=PNG_COMPRESS_LEVEL):
+    """Encode img as PNG in memory and return the bytes."""
+    buf = io.BytesIO()
+    img.save(buf, 'PNG', compress_level=compress_level)
+    return buf.getvalue()
+
+def add_pngs_to_tar(tar, encoded, mtime):
+    """
+    Append in-memory PNGs to an open tar archive.
+
+    The generators' worker processes encode figures in memory and only the
+    main process writes the archive, as one sequential file instead of
+    thousands of small ones.
+
+    Parameters:
+    - tar: TarFile opened for writing
+    - encoded: list of (filename, PNG bytes) tuples
+    - mtime: integer modification time for every member; a float would make
+      tarfile add an extra PAX header to each one
+    """
+    for filename, data in encoded:
+        info = tarfile.TarInfo(filename)
+        info.size = len(data)
+        info.mtime = mtime
+        tar.addfile(info, io.BytesIO(data))
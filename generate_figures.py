@@ -6,15 +6,26 @@ Creates a series of geometric line drawings based on specified parameters.
 
 import os
 import math
+import time
+import tarfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from PIL import Image, ImageDraw
-from itertools import product
+from itertools import product, repeat, islice
+from tqdm import tqdm
+
+from figure_io import add_pngs_to_tar, encode_png, save_png
 
 # Canvas dimensions
 CANVAS_WIDTH = 300
 CANVAS_HEIGHT = 500
 
-# Anti-aliasing settings
-SCALE_FACTOR = 10  # Render at 4x resolution for anti-aliasing
+# Output filename, filled positionally from a parameter combination
+FILENAME_TEMPLATE = "fig_a{}_b{}_g{}_c{}_y{}_d{}_e{}_f{}_h{}_w{}.png"
+
+# Number of combinations rendered per worker task
+BATCH_SIZE = 64
 
 # Parameter ranges (reduced for manageable image count)
 PARAM_RANGES = {
@@ -30,47 +41,29 @@ PARAM_RANGES = {
     'stroke_width': [3,6]
 }
 
+@lru_cache(maxsize=None)
+def _angle_direction(angle_degrees):
+    """
+    Unit direction (sin, cos) for an angle measured clockwise from vertical.
+    Cached, since the angle parameters only take a handful of values.
+    """
+    angle_rad = math.radians(angle_degrees)
+    return math.sin(angle_rad), math.cos(angle_rad)
+
 def calculate_point_from_angle(start_x, start_y, angle_degrees, distance):
     """
     Calculate end point given start point, angle (from vertical), and distance.
     Angle is measured clockwise from vertical (downward).
     """
-    # Convert angle to radians
-    angle_rad = math.radians(angle_degrees)
+    sin_a, cos_a = _angle_direction(angle_degrees)
 
     # Calculate end point (angle measured from vertical, clockwise)
-    end_x = start_x + distance * math.sin(angle_rad)
-    end_y = start_y + distance * math.cos(angle_rad)
+    end_x = start_x + distance * sin_a
+    end_y = start_y + distance * cos_a
 
     return end_x, end_y
 
-def draw_antialiased_line(draw, x1, y1, x2, y2, width, color='black'):
-    """Draw an anti-aliased line by creating a polygon for the line."""
-    # Calculate perpendicular vector for line thickness
-    dx = x2 - x1
-    dy = y2 - y1
-    length = math.sqrt(dx*dx + dy*dy)
-
-    if length == 0:
-        return
-
-    # Normalize and get perpendicular
-    dx /= length
-    dy /= length
-    px = -dy * width / 2
-    py = dx * width / 2
-
-    # Create polygon points for thick line
-    points = [
-        (x1 + px, y1 + py),
-        (x1 - px, y1 - py),
-        (x2 - px, y2 - py),
-        (x2 + px, y2 + py)
-    ]
-
-    draw.polygon(points, fill=color)
-
-def generate_figure(a, b, g, c, y, d, e, f, h, stroke_width):
+def generate_figure(a, b, g, c, y, d, e, f, h, stroke_width, canvas=None):
     """
     Generate a single figure with the given parameters.
 
@@ -85,32 +78,28 @@ def generate_figure(a, b, g, c, y, d, e, f, h, stroke_width):
     - f: horizontal length for additional stroke
     - h: vertical length for additional stroke
     - stroke_width: width of the stroke
+    - canvas: optional CANVAS_WIDTH x CANVAS_HEIGHT RGB image to draw on.
+      It is cleared and returned, so the caller must be done with the
+      previous figure before passing the same canvas again.
     """
-    # Create image at higher resolution for anti-aliasing
-    img = Image.new('RGBA',
-                    (CANVAS_WIDTH * SCALE_FACTOR, CANVAS_HEIGHT * SCALE_FACTOR),
-                    (255, 255, 255, 255))
-    draw = ImageDraw.Draw(img, 'RGBA')
-
-    # Starting point for downstroke (scaled)
-    x_center = 150 * SCALE_FACTOR
-
-    # Build the path (scale all coordinates)
+    # Draw directly at the final resolution, reusing the canvas if given
+    if canvas is None:
+        img = Image.new('RGB', (CANVAS_WIDTH, CANVAS_HEIGHT), 'white')
+    else:
+        img = canvas
+    draw = ImageDraw.Draw(img)
+    if canvas is not None:
+        draw.rectangle([0, 0, CANVAS_WIDTH, CANVAS_HEIGHT], fill='white')
+
+    # Starting point for downstroke
+    x_center = 150
+
+    # Build the path
     points = []
 
-    # Scale parameters
-    a_scaled = a * SCALE_FACTOR
-    b_scaled = b * SCALE_FACTOR
-    c_scaled = c * SCALE_FACTOR
-    d_scaled = d * SCALE_FACTOR
-    e_scaled = e * SCALE_FACTOR
-    f_scaled = f * SCALE_FACTOR
-    h_scaled = h * SCALE_FACTOR
-    stroke_scaled = stroke_width * SCALE_FACTOR
-
     # 1. Downstroke from (150, 0) to (150, a)
     points.append((x_center, 0))
-    points.append((x_center, a_scaled))
+    points.append((x_center, a))
 
     # 2. Turn left by g degrees and continue for q pixels until reaching (150+d, a+b)
     # We need to calculate q such that we reach (150+d, a+b)
@@ -119,8 +108,8 @@ def generate_figure(a, b, g, c, y, d, e, f, h, stroke_width):
     # Using trigonometry: horizontal = q * sin(g), vertical = q * cos(g)
     # d = q * sin(g) and b = q * cos(g)
     # Therefore: q = sqrt(d^2 + b^2)
-    q = math.sqrt(d_scaled**2 + b_scaled**2)
-    end_x, end_y = calculate_point_from_angle(x_center, a_scaled, g, q)
+    q = math.hypot(d, b)
+    end_x, end_y = calculate_point_from_angle(x_center, a, g, q)
     points.append((end_x, end_y))
 
     # 3. Continue to point (150, a+b)
@@ -128,75 +117,115 @@ def generate_figure(a, b, g, c, y, d, e, f, h, stroke_width):
     points.append((x_center, end_y))
 
     # 4. Continue downwards for c pixels to (150, a+b+c)
-    points.append((x_center, a_scaled + b_scaled + c_scaled))
+    points.append((x_center, a + b + c))
 
     # 5. Go to point (150-d, a+b+c)
-    points.append((x_center - d_scaled, a_scaled + b_scaled + c_scaled))
+    points.append((x_center - d, a + b + c))
 
     # 6. Turn right by y degrees and continue for d pixels
     # From (150-d, a+b+c), turning right by y degrees, going distance d
     # Right turn means negative angle
-    end_x2, end_y2 = calculate_point_from_angle(x_center - d_scaled, a_scaled + b_scaled + c_scaled, -y, d_scaled)
+    end_x2, end_y2 = calculate_point_from_angle(x_center - d, a + b + c, -y, d)
     points.append((end_x2, end_y2))
 
     # 7. Continue downwards for the rest of the canvas
-    points.append((end_x2, CANVAS_HEIGHT * SCALE_FACTOR))
+    points.append((end_x2, CANVAS_HEIGHT))
 
     # Additional strokes as requested:
     # Stroke from (150-e, a) to (150-e-f, a)
-    additional_points = []
-    point_a = (x_center - e_scaled, a_scaled)
-    point_b = (x_center - e_scaled - f_scaled, a_scaled)
-    additional_points.append(point_a)
-    additional_points.append(point_b)
+    point_a = (x_center - e, a)
+    point_b = (x_center - e - f, a)
 
     # Stroke from (150-e-f, a) to (150-e, a+h)
-    point_c = (x_center - e_scaled, a_scaled + h_scaled)
-    additional_points.append(point_c)
-
-    # Draw the main lines using polygon method for better anti-aliasing
-    for i in range(len(points) - 1):
-        draw_antialiased_line(draw, points[i][0], points[i][1],
-                            points[i+1][0], points[i+1][1],
-                            stroke_scaled, 'black')
-
-    # Draw the additional strokes
-    # First stroke: (150-e, a) to (150-e-f, a)
-    draw_antialiased_line(draw, point_a[0], point_a[1],
-                        point_b[0], point_b[1],
-                        stroke_scaled, 'black')
-
-    # Second stroke: (150-e-f, a) to (150-e, a+h)
-    draw_antialiased_line(draw, point_b[0], point_b[1],
-                        point_c[0], point_c[1],
-                        stroke_scaled, 'black')
-
-    # Add circles at joints for smooth connections (main path)
-    for point in points:
-        left_up = (point[0] - stroke_scaled/2, point[1] - stroke_scaled/2)
-        right_down = (point[0] + stroke_scaled/2, point[1] + stroke_scaled/2)
+    point_c = (x_center - e, a + h)
+    additional_points = [point_a, point_b, point_c]
+
+    # Draw each path as a single polyline; joint='curve' rounds the joints
+    draw.line(points, fill='black', width=stroke_width, joint='curve')
+    draw.line(additional_points, fill='black', width=stroke_width, joint='curve')
+
+    # Round the free ends of the additional strokes (the main path runs
+    # off the top and bottom edges of the canvas)
+    for point in (point_a, point_c):
+        left_up = (point[0] - stroke_width/2, point[1] - stroke_width/2)
+        right_down = (point[0] + stroke_width/2, point[1] + stroke_width/2)
         draw.ellipse([left_up, right_down], fill='black')
 
-    # Add circles at joints for additional strokes
-    for point in additional_points:
-        left_up = (point[0] - stroke_scaled/2, point[1] - stroke_scaled/2)
-        right_down = (point[0] + stroke_scaled/2, point[1] + stroke_scaled/2)
-        draw.ellipse([left_up, right_down], fill='black')
+    return img
 
-    # Downsample to original size with high-quality anti-aliasing
-    img = img.resize((CANVAS_WIDTH, CANVAS_HEIGHT), Image.LANCZOS)
+# Per-process canvas reused by the batch workers. Each worker process renders
+# and saves one figure at a time, so the canvas is never shared while in use.
+_CANVAS = None
 
-    # Convert back to RGB
-    rgb_img = Image.new('RGB', (CANVAS_WIDTH, CANVAS_HEIGHT), 'white')
-    rgb_img.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else None)
+def _render(combination):
+    """Render one parameter combination on the per-process canvas."""
+    global _CANVAS
+    if _CANVAS is None:
+        _CANVAS = Image.new('RGB', (CANVAS_WIDTH, CANVAS_HEIGHT), 'white')
+    return generate_figure(*combination, canvas=_CANVAS)
+
+def _render_batch(combinations, output_dir, skip_existing=False):
+    """
+    Render a batch of parameter combinations and save them as PNGs (worker process).
 
-    return rgb_img
+    With skip_existing, figures whose file is already there are left as is.
+
+    Returns:
+    - tuple of (figures rendered, figures skipped)
+    """
+    skipped = 0
+    for combination in combinations:
+        filepath = os.path.join(output_dir, FILENAME_TEMPLATE.format(*combination))
+        if skip_existing and os.path.exists(filepath):
+            skipped += 1
+            continue
+        save_png(_render(combination), filepath)
+
+    return len(combinations) - skipped, skipped
+
+def _encode_batch(combinations):
+    """
+    Render a batch of parameter combinations into in-memory PNGs (worker process).
+
+    Returns:
+    - list of (filename, PNG bytes) tuples
+    """
+    return [
+        (FILENAME_TEMPLATE.format(*combination), encode_png(_render(combination)))
+        for combination in combinations
+    ]
+
+def _batched(iterable, size):
+    """Yield successive tuples of up to size items from iterable."""
+    iterator = iter(iterable)
+    while batch := tuple(islice(iterator, size)):
+        yield batch
 
 def main():
     """Generate all combinations of figures."""
-    # Create output directory
+    parser = argparse.ArgumentParser(description='Generate all combinations of angled figures')
+    parser.add_argument(
+        '--format',
+        choices=['png', 'tar'],
+        default='png',
+        help='png: one file per figure in ./data (default); '
+             'tar: all figures in a single ./data.tar archive'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='re-render figures that already exist in ./data '
+             '(by default they are kept, so an interrupted run can be resumed)'
+    )
+    args = parser.parse_args()
+
+    # Create output directory (or archive)
     output_dir = './data'
-    os.makedirs(output_dir, exist_ok=True)
+    if args.format == 'tar':
+        output_path = f'{output_dir}.tar'
+    else:
+        output_path = output_dir
+        os.makedirs(output_dir, exist_ok=True)
 
     # Calculate total combinations
     total = 1
@@ -204,33 +233,36 @@ def main():
         total *= len(param_range)
 
     print(f"Generating {total:,} images...")
-    print(f"Output directory: {output_dir}")
+    print(f"Output: {output_path}")
 
     # Generate all combinations
     count = 0
+    skipped = 0
     param_names = ['a', 'b', 'g', 'c', 'y', 'd', 'e', 'f', 'h', 'stroke_width']
     param_values = [PARAM_RANGES[name] for name in param_names]
 
-    for combination in product(*param_values):
-        a, b, g, c, y, d, e, f, h, stroke_width = combination
-
-        # Generate the figure
-        img = generate_figure(a, b, g, c, y, d, e, f, h, stroke_width)
-
-        # Create filename
-        filename = f"fig_a{a}_b{b}_g{g}_c{c}_y{y}_d{d}_e{e}_f{f}_h{h}_w{stroke_width}.png"
-        filepath = os.path.join(output_dir, filename)
-
-        # Save the image
-        img.save(filepath, 'PNG')
-
-        count += 1
-
-        # Progress update every 10000 images
-        if count % 10000 == 0:
-            print(f"Progress: {count:,}/{total:,} ({100*count/total:.1f}%)")
-
-    print(f"\nCompleted! Generated {count:,} images in {output_dir}/")
+    # Every figure is independent, so render them in parallel worker processes.
+    # Each task is a whole batch, so only one small result comes back per batch.
+    batches = _batched(product(*param_values), BATCH_SIZE)
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor, \
+            tqdm(total=total, desc="Generating figures", unit="img") as progress:
+        if args.format == 'tar':
+            mtime = int(time.time())
+            with tarfile.open(output_path, 'w') as tar:
+                for encoded in executor.map(_encode_batch, batches):
+                    add_pngs_to_tar(tar, encoded, mtime)
+                    count += len(encoded)
+                    progress.update(len(encoded))
+        else:
+            for rendered, kept in executor.map(_render_batch, batches, repeat(output_dir),
+                                               repeat(not args.force)):
+                count += rendered
+                skipped += kept
+                progress.update(rendered + kept)
+
+    print(f"\nCompleted! Generated {count:,} images in {output_path}")
+    if skipped:
+        print(f"Kept {skipped:,} existing images (use --force to re-render them)")
 
 if __name__ == '__main__':
     main()
@@ -5,16 +5,23 @@ Creates a series of geometric line drawings based on specified parameters.
 """
 
 import os
-import math
-from PIL import Image, ImageDraw
+import time
+import tarfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial, lru_cache
+from PIL import Image, ImageDraw, ImageColor
 from itertools import product
 
+from figure_io import add_pngs_to_tar, encode_png, save_png, PNG_COMPRESS_LEVEL
+
 # Canvas dimensions
 CANVAS_WIDTH = 300
 CANVAS_HEIGHT = 500
 
-# Anti-aliasing settings
-SCALE_FACTOR = 10  # Render at 10x resolution for anti-aliasing
+# Output filename, filled positionally from a geometry plus the color code
+# (the stroke color without its '#')
+FILENAME_TEMPLATE = "fig_a{}_b{}_c{}_d{}_e{}_f{}_g{}_w{}_col{}.png"
 
 # Parameter ranges (simplified - no angle parameters)
 PARAM_RANGES = {
@@ -29,147 +36,277 @@ PARAM_RANGES = {
     'stroke_color': ['#000000', '#222222', '#444444', '#666666']
 }
 
-def draw_antialiased_line(draw, x1, y1, x2, y2, width, color='black'):
-    """Draw an anti-aliased line by creating a polygon for the line."""
-    # Calculate perpendicular vector for line thickness
-    dx = x2 - x1
-    dy = y2 - y1
-    length = math.sqrt(dx*dx + dy*dy)
-
-    if length == 0:
-        return
-
-    # Normalize and get perpendicular
-    dx /= length
-    dy /= length
-    px = -dy * width / 2
-    py = dx * width / 2
-
-    # Create polygon points for thick line
-    points = [
-        (x1 + px, y1 + py),
-        (x1 - px, y1 - py),
-        (x2 - px, y2 - py),
-        (x2 + px, y2 + py)
-    ]
-
-    draw.polygon(points, fill=color)
+# Supersampling factor for anti-aliased edges (1 = draw at final size).
+# Integer factors are downsampled with Image.reduce, a box filter that is
+# far cheaper than a LANCZOS resize and just as clean on line art.
+SCALE_FACTOR = 1
 
-def generate_figure(a, b, c, d, e, f, g, stroke_width, stroke_color):
+@lru_cache(maxsize=16)
+def _main_path_mask(a, b, c, d, stroke_width, scale_factor):
     """
-    Generate a single figure with the given parameters (simplified geometry).
-
-    Parameters:
-    - a: vertical distance for first downstroke
-    - b: vertical component of diagonal segment
-    - c: horizontal offset for diagonal
-    - d: horizontal/vertical distance for segments
-    - e: horizontal offset for additional strokes
-    - f: horizontal length for additional stroke
-    - g: vertical length for additional stroke
-    - stroke_width: width of the stroke
-    - stroke_color: color of the stroke (hex format)
+    Draw the main path (segments 1-7) on its own, as a coverage mask.
+
+    The main path does not depend on e, f or g. The parameter sweep varies
+    stroke_width fastest and e, f, g just above it, so consecutive figures
+    alternate between one mask per stroke width for a run of e/f/g values.
+    The cache must therefore hold at least len(stroke_width) masks (a cache
+    of one would miss every time). Each mask is drawn once and pasted for
+    every figure that shares it. Callers must not modify the returned image.
     """
-    # Create image at higher resolution for anti-aliasing
-    img = Image.new('RGBA',
-                    (CANVAS_WIDTH * SCALE_FACTOR, CANVAS_HEIGHT * SCALE_FACTOR),
-                    (255, 255, 255, 255))
-    draw = ImageDraw.Draw(img, 'RGBA')
-
-    # Starting point for downstroke (scaled)
-    x_center = 150 * SCALE_FACTOR
-
-    # Scale parameters
-    a_scaled = a * SCALE_FACTOR
-    b_scaled = b * SCALE_FACTOR
-    c_scaled = c * SCALE_FACTOR
-    d_scaled = d * SCALE_FACTOR
-    e_scaled = e * SCALE_FACTOR
-    f_scaled = f * SCALE_FACTOR
-    g_scaled = g * SCALE_FACTOR
-    stroke_scaled = stroke_width * SCALE_FACTOR
+    img = Image.new('L', (CANVAS_WIDTH * scale_factor, CANVAS_HEIGHT * scale_factor), 0)
+    draw = ImageDraw.Draw(img)
+
+    # Starting point for downstroke
+    x_center = 150
 
     # Build the main path with simplified straight-line geometry
     points = []
 
     # 1. from (150,0) to (150,a)
     points.append((x_center, 0))
-    points.append((x_center, a_scaled))
+    points.append((x_center, a))
 
     # 2. from (150,a) to (150+c,a+b)
-    points.append((x_center + c_scaled, a_scaled + b_scaled))
+    points.append((x_center + c, a + b))
 
     # 3. from (150+c,a+b) to (150,a+b)
-    points.append((x_center, a_scaled + b_scaled))
+    points.append((x_center, a + b))
 
     # 4. from (150,a+b) to (150,a+b+c)
-    points.append((x_center, a_scaled + b_scaled + c_scaled))
+    points.append((x_center, a + b + c))
 
     # 5. from (150,a+b+c) to (150-d,a+b+c)
-    points.append((x_center - d_scaled, a_scaled + b_scaled + c_scaled))
+    points.append((x_center - d, a + b + c))
 
     # 6. from (150-d,a+b+c) to (150,a+b+c+d)
-    points.append((x_center, a_scaled + b_scaled + c_scaled + d_scaled))
+    points.append((x_center, a + b + c + d))
 
     # 7. from (150,a+b+c+d) to (150,500)
-    points.append((x_center, CANVAS_HEIGHT * SCALE_FACTOR))
+    points.append((x_center, CANVAS_HEIGHT))
 
-    # Additional strokes as separate elements:
-    additional_points = []
+    if scale_factor > 1:
+        points = [(x * scale_factor, y * scale_factor) for x, y in points]
+
+    # Draw the path as a single polyline; joint='curve' rounds the joints
+    draw.line(points, fill=255, width=stroke_width * scale_factor, joint='curve')
+    return img
+
+def render_mask(a, b, c, d, e, f, g, stroke_width, canvas=None, scale_factor=SCALE_FACTOR):
+    """
+    Draw the figure geometry as a coverage mask (simplified geometry).
 
+    Parameters:
+    - a: vertical distance for first downstroke
+    - b: vertical component of diagonal segment
+    - c: horizontal offset for diagonal
+    - d: horizontal/vertical distance for segments
+    - e: horizontal offset for additional strokes
+    - f: horizontal length for additional stroke
+    - g: vertical length for additional stroke
+    - stroke_width: width of the stroke
+    - canvas: optional 'L' image to draw on, CANVAS_WIDTH x CANVAS_HEIGHT
+      times scale_factor. It is overwritten and drawn on, so the caller must
+      be done with the previous mask before passing the same canvas again.
+    - scale_factor: integer supersampling factor; above 1 the figure is drawn
+      that much larger and box-filtered down for anti-aliased edges
+
+    Returns:
+    - 'L' image: 255 where the stroke is, 0 for the background
+    """
+    # Start from the cached main path, on the canvas if given
+    main_path = _main_path_mask(a, b, c, d, stroke_width, scale_factor)
+    if canvas is None:
+        img = main_path.copy()
+    else:
+        img = canvas
+        img.paste(main_path)
+    draw = ImageDraw.Draw(img)
+
+    # Starting point for downstroke
+    x_center = 150
+
+    # Additional strokes as separate elements:
     # 8. from (150-e,a) to (150-e-f,a)
-    point_a = (x_center - e_scaled, a_scaled)
-    point_b = (x_center - e_scaled - f_scaled, a_scaled)
-    additional_points.append(point_a)
-    additional_points.append(point_b)
+    point_a = (x_center - e, a)
+    point_b = (x_center - e - f, a)
 
     # 9. from (150-e-f,a) to (150-e,a+g)
-    point_c = (x_center - e_scaled, a_scaled + g_scaled)
-    additional_points.append(point_c)
-
-    # Draw the main lines using polygon method for better anti-aliasing
-    for i in range(len(points) - 1):
-        draw_antialiased_line(draw, points[i][0], points[i][1],
-                            points[i+1][0], points[i+1][1],
-                            stroke_scaled, stroke_color)
-
-    # Draw the additional strokes
-    # Stroke 8: (150-e, a) to (150-e-f, a)
-    draw_antialiased_line(draw, point_a[0], point_a[1],
-                        point_b[0], point_b[1],
-                        stroke_scaled, stroke_color)
-
-    # Stroke 9: (150-e-f, a) to (150-e, a+g)
-    draw_antialiased_line(draw, point_b[0], point_b[1],
-                        point_c[0], point_c[1],
-                        stroke_scaled, stroke_color)
-
-    # Add circles at joints for smooth connections (main path)
-    for point in points:
-        left_up = (point[0] - stroke_scaled/2, point[1] - stroke_scaled/2)
-        right_down = (point[0] + stroke_scaled/2, point[1] + stroke_scaled/2)
-        draw.ellipse([left_up, right_down], fill=stroke_color)
-
-    # Add circles at joints for additional strokes
-    for point in additional_points:
-        left_up = (point[0] - stroke_scaled/2, point[1] - stroke_scaled/2)
-        right_down = (point[0] + stroke_scaled/2, point[1] + stroke_scaled/2)
-        draw.ellipse([left_up, right_down], fill=stroke_color)
-
-    # Downsample to original size with high-quality anti-aliasing
-    img = img.resize((CANVAS_WIDTH, CANVAS_HEIGHT), Image.LANCZOS)
-
-    # Convert back to RGB
-    rgb_img = Image.new('RGB', (CANVAS_WIDTH, CANVAS_HEIGHT), 'white')
-    rgb_img.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else None)
-
-    return rgb_img
+    point_c = (x_center - e, a + g)
+    additional_points = [point_a, point_b, point_c]
+
+    if scale_factor > 1:
+        additional_points = [(x * scale_factor, y * scale_factor) for x, y in additional_points]
+        point_a, _, point_c = additional_points
+        stroke_width *= scale_factor
+
+    draw.line(additional_points, fill=255, width=stroke_width, joint='curve')
+
+    # Round the free ends of strokes 8 and 9 (the main path runs off the
+    # top and bottom edges of the canvas)
+    for point in (point_a, point_c):
+        left_up = (point[0] - stroke_width/2, point[1] - stroke_width/2)
+        right_down = (point[0] + stroke_width/2, point[1] + stroke_width/2)
+        draw.ellipse([left_up, right_down], fill=255)
+
+    if scale_factor > 1:
+        # Average each scale_factor x scale_factor block into one pixel
+        return img.reduce(scale_factor)
+    return img
+
+@lru_cache(maxsize=None)
+def _stroke_palette(stroke_color):
+    """
+    Build the white-to-stroke_color palette used by colorize().
+
+    Cached, so each color's hex string is parsed and its palette computed
+    only once per process.
+    """
+    r, g, b = ImageColor.getrgb(stroke_color)[:3]
+    palette = []
+    for i in range(256):
+        palette.extend((
+            255 + (r - 255) * i // 255,
+            255 + (g - 255) * i // 255,
+            255 + (b - 255) * i // 255,
+        ))
+    return palette
+
+def colorize(mask, stroke_color):
+    """
+    Paint a coverage mask in stroke_color over a white background.
+
+    The mask is reused as the pixel data of a palette image whose entry i
+    blends white towards stroke_color by i/255, so recoloring a figure only
+    copies the mask instead of drawing it again.
+
+    Parameters:
+    - mask: 'L' image from render_mask()
+    - stroke_color: color of the stroke (hex format)
+
+    Returns:
+    - palette ('P') image of the figure
+    """
+    img = mask.copy()
+    img.putpalette(_stroke_palette(stroke_color))
+    return img
+
+def generate_figure(a, b, c, d, e, f, g, stroke_width, stroke_color, canvas=None,
+                    scale_factor=SCALE_FACTOR):
+    """
+    Generate a single figure with the given parameters (simplified geometry).
+
+    Parameters are those of render_mask() plus:
+    - stroke_color: color of the stroke (hex format)
+
+    The canvas (if given) only holds the mask, so the returned palette
+    image never shares pixels with it.
+    """
+    mask = render_mask(a, b, c, d, e, f, g, stroke_width, canvas=canvas, scale_factor=scale_factor)
+    return colorize(mask, stroke_color)
+
+# Mask canvas kept by each worker process (see _render_colors)
+_CANVAS = None
+
+def _render_colors(geometry, stroke_colors, scale_factor):
+    """
+    Render one geometry once on the per-process canvas and yield it in each
+    stroke color as (filename, image) pairs.
+
+    The mask stays on the canvas only until the generator is exhausted, as
+    colorize() copies it, so the canvas is free again for the next geometry.
+    """
+    global _CANVAS
+    canvas_size = (CANVAS_WIDTH * scale_factor, CANVAS_HEIGHT * scale_factor)
+    if _CANVAS is None or _CANVAS.size != canvas_size:
+        _CANVAS = Image.new('L', canvas_size, 0)
+
+    # Rasterize the geometry once, then only recolor it
+    mask = render_mask(*geometry, canvas=_CANVAS, scale_factor=scale_factor)
+
+    for stroke_color in stroke_colors:
+        # Create filename (remove # from color for filename)
+        filename = FILENAME_TEMPLATE.format(*geometry, stroke_color.replace('#', ''))
+        yield filename, colorize(mask, stroke_color)
+
+def render_and_save(geometry, stroke_colors, output_dir, compress_level=PNG_COMPRESS_LEVEL,
+                    scale_factor=SCALE_FACTOR, skip_existing=False):
+    """
+    Render one geometry once and save it as a PNG in each stroke color.
+
+    Module-level so it can be sent to worker processes.
+
+    Parameters:
+    - geometry: tuple of (a, b, c, d, e, f, g, stroke_width)
+    - stroke_colors: list of stroke colors (hex format)
+    - output_dir: folder to save the figures in
+    - compress_level: PNG compression level (0-9)
+    - scale_factor: supersampling factor, see render_mask()
+    - skip_existing: leave figures whose file already exists untouched (the
+      geometry is not rendered at all if every color is already there)
+
+    Returns:
+    - tuple of (figures saved, figures skipped)
+    """
+    missing_colors = stroke_colors
+    if skip_existing:
+        missing_colors = []
+        for stroke_color in stroke_colors:
+            filename = FILENAME_TEMPLATE.format(*geometry, stroke_color.replace('#', ''))
+            if not os.path.exists(os.path.join(output_dir, filename)):
+                missing_colors.append(stroke_color)
+
+    if missing_colors:
+        for filename, img in _render_colors(geometry, missing_colors, scale_factor):
+            save_png(img, os.path.join(output_dir, filename), compress_level)
+
+    return len(missing_colors), len(stroke_colors) - len(missing_colors)
+
+def render_and_encode(geometry, stroke_colors, compress_level=PNG_COMPRESS_LEVEL,
+                      scale_factor=SCALE_FACTOR):
+    """
+    Render one geometry once into an in-memory PNG per stroke color.
+
+    Same as render_and_save(), but the PNGs are returned to the caller
+    (e.g. to be written into an archive) instead of saved as files.
+
+    Returns:
+    - list of (filename, PNG bytes) tuples
+    """
+    return [
+        (filename, encode_png(img, compress_level))
+        for filename, img in _render_colors(geometry, stroke_colors, scale_factor)
+    ]
+
+def _print_progress(previous, done, total):
+    """Print a progress update each time done passes a multiple of 1000 images."""
+    if done // 1000 > previous // 1000:
+        print(f"Progress: {done:,}/{total:,} ({100*done/total:.1f}%)")
 
 def main():
     """Generate all combinations of figures."""
-    # Create output directory
+    parser = argparse.ArgumentParser(description='Generate all combinations of simple figures')
+    parser.add_argument(
+        '--format',
+        choices=['png', 'tar'],
+        default='png',
+        help='png: one file per figure in ./data_simple (default); '
+             'tar: all figures in a single ./data_simple.tar archive'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='re-render figures that already exist in ./data_simple '
+             '(by default they are kept, so an interrupted run can be resumed)'
+    )
+    args = parser.parse_args()
+
+    # Create output directory (or archive)
     output_dir = './data_simple'
-    os.makedirs(output_dir, exist_ok=True)
+    if args.format == 'tar':
+        output_path = f'{output_dir}.tar'
+    else:
+        output_path = output_dir
+        os.makedirs(output_dir, exist_ok=True)
 
     # Calculate total combinations
     total = 1
@@ -177,34 +314,39 @@ def main():
         total *= len(param_range)
 
     print(f"Generating {total:,} images (simplified geometry)...")
-    print(f"Output directory: {output_dir}")
+    print(f"Output: {output_path}")
 
     # Generate all combinations
     count = 0
-    param_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'stroke_width', 'stroke_color']
+    skipped = 0
+    param_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'stroke_width']
     param_values = [PARAM_RANGES[name] for name in param_names]
-
-    for combination in product(*param_values):
-        a, b, c, d, e, f, g, stroke_width, stroke_color = combination
-
-        # Generate the figure
-        img = generate_figure(a, b, c, d, e, f, g, stroke_width, stroke_color)
-
-        # Create filename (remove # from color for filename)
-        color_code = stroke_color.replace('#', '')
-        filename = f"fig_a{a}_b{b}_c{c}_d{d}_e{e}_f{f}_g{g}_w{stroke_width}_col{color_code}.png"
-        filepath = os.path.join(output_dir, filename)
-
-        # Save the image
-        img.save(filepath, 'PNG')
-
-        count += 1
-
-        # Progress update every 1000 images
-        if count % 1000 == 0:
-            print(f"Progress: {count:,}/{total:,} ({100*count/total:.1f}%)")
-
-    print(f"\nCompleted! Generated {count:,} images in {output_dir}/")
+    stroke_colors = PARAM_RANGES['stroke_color']
+
+    # Every geometry is independent, so render them in parallel worker
+    # processes; each one is drawn once and saved in every stroke color
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        if args.format == 'tar':
+            mtime = int(time.time())
+            with tarfile.open(output_path, 'w') as tar:
+                for encoded in executor.map(partial(render_and_encode, stroke_colors=stroke_colors),
+                                            product(*param_values), chunksize=32):
+                    add_pngs_to_tar(tar, encoded, mtime)
+                    count += len(encoded)
+                    _print_progress(count - len(encoded), count, total)
+        else:
+            for saved, kept in executor.map(partial(render_and_save, stroke_colors=stroke_colors,
+                                                    output_dir=output_dir,
+                                                    skip_existing=not args.force),
+                                            product(*param_values), chunksize=32):
+                previous = count + skipped
+                count += saved
+                skipped += kept
+                _print_progress(previous, count + skipped, total)
+
+    print(f"\nCompleted! Generated {count:,} images in {output_path}")
+    if skipped:
+        print(f"Kept {skipped:,} existing images (use --force to re-render them)")
 
 if __name__ == '__main__':
-    main()
+    main()
\ No newline at end of file
@@ -8,9 +8,10 @@ Combines figure generation and collage creation into a single workflow.
 import os
 import sys
 import argparse
-import subprocess
 from tqdm import tqdm
 
+from figure_io import PNG_COMPRESS_LEVEL
+
 def parse_range_param(param_str, as_int=True):
     """
     Parse parameter range string like '50,100,150' into a list.
@@ -20,14 +21,16 @@ def parse_range_param(param_str, as_int=True):
     - as_int: whether to convert values to integers (True) or keep as strings (False)
 
     Returns:
-    - list of values (as integers or strings depending on parameter type)
+    - list of unique values in the order given (as integers or strings
+      depending on parameter type)
     """
     if not param_str:
         return None
     values = [p.strip() for p in param_str.split(',')]
     if as_int:
-        return [int(v) for v in values]
-    return values
+        values = [int(v) for v in values]
+    # Repeated values would render (and write) the same figures twice
+    return list(dict.fromkeys(values))
 
 def main():
     parser = argparse.ArgumentParser(
@@ -44,6 +47,12 @@ Examples:
 
   # Generate only (skip collage)
   %(prog)s --a=100,130 --b=50,100 --output_folder ./figures --skip_collage
+
+  # Final-quality figures: 4x supersampled edges, smallest PNG files
+  %(prog)s --a=100,130 --output_folder ./figures --scale_factor 4 --png_compress_level 9
+
+  # Leave two cores free while generating
+  %(prog)s --a=100,130 --output_folder ./figures --workers 2
         """
     )
 
@@ -67,6 +76,37 @@ Examples:
         help='Output folder for generated figures (will be input for collage)'
     )
 
+    parser.add_argument(
+        '--png_compress_level',
+        type=int,
+        default=PNG_COMPRESS_LEVEL,
+        choices=range(10),
+        metavar='{0-9}',
+        help=f'PNG compression level for generated figures (default: {PNG_COMPRESS_LEVEL}, fastest with compression)'
+    )
+
+    parser.add_argument(
+        '--scale_factor',
+        type=int,
+        default=1,
+        help='Supersampling factor for anti-aliased figure edges (default: 1, no supersampling; 4 gives smooth edges)'
+    )
+
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Re-render figures that already exist in the output folder. By default they are kept as they '
+             'are, even if they were made with a different --scale_factor or --png_compress_level, so pass '
+             '--force after changing either'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help=f'Number of worker processes for figure generation (default: {os.cpu_count() or 1}, all cores)'
+    )
+
     # Collage parameters
     collage_group = parser.add_argument_group('Collage Parameters')
     collage_group.add_argument(
@@ -117,6 +157,13 @@ Examples:
         print("Error: Cannot skip both generation and collage creation")
         sys.exit(1)
 
+    if args.scale_factor < 1:
+        print(f"Error: scale_factor must be at least 1, got {args.scale_factor}")
+        sys.exit(1)
+    if args.workers < 1:
+        print(f"Error: workers must be at least 1, got {args.workers}")
+        sys.exit(1)
+
     # === STEP 1: Generate Figures ===
     if not args.skip_generation:
         print("=" * 60)
@@ -152,8 +199,10 @@ Examples:
 
         # Import generation functions
         try:
-            from generate_figures_simple import generate_figure
+            from generate_figures_simple import render_and_save
             from itertools import product
+            from functools import partial
+            from concurrent.futures import ProcessPoolExecutor
         except ImportError as e:
             print(f"Error importing generate_figures_simple: {e}")
             sys.exit(1)
@@ -211,26 +260,31 @@ Examples:
         print(f"Output directory: {args.output_folder}\n")
 
         # Generate all combinations
-        param_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'stroke_width', 'stroke_color']
+        param_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'stroke_width']
         param_values = [default_param_ranges[name] for name in param_names]
-
-        # Use tqdm for progress bar
-        combinations = list(product(*param_values))
-        for combination in tqdm(combinations, desc="Generating figures", unit="img"):
-            a, b, c, d, e, f, g, stroke_width, stroke_color = combination
-
-            # Generate the figure
-            img = generate_figure(a, b, c, d, e, f, g, stroke_width, stroke_color)
-
-            # Create filename (remove # from color for filename)
-            color_code = stroke_color.replace('#', '')
-            filename = f"fig_a{a}_b{b}_c{c}_d{d}_e{e}_f{f}_g{g}_w{stroke_width}_col{color_code}.png"
-            filepath = os.path.join(args.output_folder, filename)
-
-            # Save the image
-            img.save(filepath, 'PNG')
-
-        print(f"Completed! Generated {total:,} images in {args.output_folder}/")
+        stroke_colors = default_param_ranges['stroke_color']
+
+        # Render each geometry once in parallel worker processes and save it in
+        # every stroke color; use tqdm for progress bar
+        geometries = list(product(*param_values))
+        with ProcessPoolExecutor(max_workers=args.workers) as executor, \
+                tqdm(total=total, desc="Generating figures", unit="img") as progress:
+            results = executor.map(partial(render_and_save, stroke_colors=stroke_colors,
+                                           output_dir=args.output_folder,
+                                           compress_level=args.png_compress_level,
+                                           scale_factor=args.scale_factor,
+                                           skip_existing=not args.force),
+                                   geometries, chunksize=32)
+            rendered = 0
+            skipped = 0
+            for saved, kept in results:
+                rendered += saved
+                skipped += kept
+                progress.update(saved + kept)
+
+        print(f"Completed! Generated {rendered:,} images in {args.output_folder}/")
+        if skipped:
+            print(f"Kept {skipped:,} existing images (use --force to re-render them)")
 
         print("\n✓ Figure generation complete")
 
@@ -249,31 +303,25 @@ Examples:
                 print(f"Error: Output folder '{args.output_folder}' does not exist")
                 sys.exit(1)
 
-            image_count = len([f for f in os.listdir(args.output_folder) if f.endswith('.png')])
+            with os.scandir(args.output_folder) as entries:
+                image_count = sum(1 for entry in entries if entry.name.endswith('.png'))
             if image_count == 0:
                 print(f"Error: No PNG images found in '{args.output_folder}'")
                 sys.exit(1)
 
             print(f"Found {image_count} images in {args.output_folder}")
 
-            # Build collage command
-            collage_cmd = [
-                'python3', 'create_collages.py',
-                '--grid_size', args.grid_size,
-                '--images_folder', args.output_folder,
-                '--output_folder', args.collage_output,
-                '--flip_hor', str(args.flip_hor),
-                '--flip_ver', str(args.flip_ver)
-            ]
-
-            if args.select_only_from:
-                collage_cmd.extend(['--select_only_from', args.select_only_from])
+            # Create the collage in this process (no interpreter startup or
+            # module re-imports)
+            from create_collages import create_collage_from_folder
 
-            # Execute collage creation
-            print(f"\nRunning: {' '.join(collage_cmd)}\n")
-            result = subprocess.run(collage_cmd)
+            print()
+            success = create_collage_from_folder(
+                args.grid_size, args.output_folder, args.collage_output,
+                args.flip_hor, args.flip_ver, args.select_only_from
+            )
 
-            if result.returncode != 0:
+            if not success:
                 print("\n✗ Collage creation failed")
                 sys.exit(1)
 
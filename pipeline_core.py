@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Shared collage assembly used by the pipeline and collage scripts.
+
+Collages are built entirely in memory: figures are rendered straight into
+the grid and only written to disk when an output folder is requested.
+"""
+
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from PIL import Image
+from tqdm import tqdm
+
+from figure_io import PNG_COMPRESS_LEVEL
+from generate_figures_simple import generate_figure, CANVAS_WIDTH, CANVAS_HEIGHT, FILENAME_TEMPLATE
+
+def new_collage(cols, rows):
+    """Create a blank white collage canvas for a COLSxROWS grid of figures."""
+    return Image.new('RGB', (CANVAS_WIDTH * cols, CANVAS_HEIGHT * rows), 'white')
+
+def tile_position(idx, cols):
+    """Return the (x, y) pixel offset of grid cell idx (row-major order)."""
+    row = idx // cols
+    col = idx % cols
+    return col * CANVAS_WIDTH, row * CANVAS_HEIGHT
+
+def flip_tile(img, flip_hor, flip_ver):
+    """Return img flipped horizontally and/or vertically as requested."""
+    if flip_hor and flip_ver:
+        # Both flips together are a half turn: one pass instead of two copies
+        return img.transpose(Image.ROTATE_180)
+    if flip_hor:
+        return img.transpose(Image.FLIP_LEFT_RIGHT)
+    if flip_ver:
+        return img.transpose(Image.FLIP_TOP_BOTTOM)
+    return img
+
+def render_tile(params, flip_hor, flip_ver, output_folder=None,
+                png_compress_level=PNG_COMPRESS_LEVEL):
+    """
+    Generate one collage tile (runs in a worker process).
+
+    Parameters:
+    - params: tuple of (a, b, c, d, e, f, g, stroke_width, stroke_color_code)
+    - flip_hor: whether to flip the figure horizontally
+    - flip_ver: whether to flip the figure vertically
+    - output_folder: if set, also save the figure there
+    - png_compress_level: zlib level (0-9) used when saving the figure
+
+    Returns:
+    - the generated PIL image
+    """
+    a, b, c, d, e, f, g, stroke_width, stroke_color_code = params
+
+    # Generate the figure (add # prefix to color)
+    img = generate_figure(a, b, c, d, e, f, g, stroke_width, f'#{stroke_color_code}')
+    img = flip_tile(img, flip_hor, flip_ver)
+
+    # Save individual image if output folder specified
+    if output_folder:
+        filename = FILENAME_TEMPLATE.format(*params)
+        filepath = os.path.join(output_folder, filename)
+        img.save(filepath, 'PNG', compress_level=png_compress_level)
+
+    return img
+
+def render_collage(tile_params, cols, rows, flip_hor=0.0, flip_ver=0.0,
+                   output_folder=None, png_compress_level=PNG_COMPRESS_LEVEL):
+    """
+    Render a collage in memory from one parameter tuple per grid cell.
+
+    Parameters:
+    - tile_params: list of cols*rows tuples, see render_tile()
+    - cols: number of columns in grid
+    - rows: number of rows in grid
+    - flip_hor: probability (0.0-1.0) that a figure will be flipped horizontally
+    - flip_ver: probability (0.0-1.0) that a figure will be flipped vertically
+    - output_folder: if set, individual figures are also saved there
+    - png_compress_level: zlib level (0-9) for the individual figures
+
+    Returns:
+    - tuple of (collage image, horizontal flip count, vertical flip count)
+    """
+    total_images = cols * rows
+
+    # Draw the flips up front in this process, so the workers only render
+    flips_hor = [random.random() < flip_hor for _ in range(total_images)]
+    flips_ver = [random.random() < flip_ver for _ in range(total_images)]
+
+    collage = new_collage(cols, rows)
+
+    # Generate images in parallel and paste each one into the grid as soon as
+    # it arrives (results come back in order, so placement is deterministic)
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = executor.map(render_tile, tile_params, flips_hor, flips_ver,
+                               repeat(output_folder), repeat(png_compress_level),
+                               chunksize=8)
+        for idx, img in enumerate(tqdm(results, total=total_images, desc="Generating images", unit="img")):
+            collage.paste(img, tile_position(idx, cols))
+
+    return collage, sum(flips_hor), sum(flips_ver)